@@ -33,6 +33,12 @@ setup(
         "boto3",
         "colorama",
     ],
+    extras_require={
+        "tests": [
+            "pytest",
+            "moto>=5",
+        ],
+    },
     entry_points={
         "console_scripts": [
             "cloudshovel=cloudshovel.main:main",
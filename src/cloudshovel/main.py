@@ -1,22 +1,20 @@
+import sys
 import argparse
 import boto3
 import botocore
 from pyfiglet import figlet_format
 from cloudshovel.utils.digger import dig, log_error, log_warning
+from cloudshovel.utils.reaper import reap
 
-def parse_args():
-    parser = argparse.ArgumentParser()
-
+def print_banner():
     print(figlet_format('CloudShovel', font='rectangles'))
 
     print("Authors:")
     print("\t- Eduard Agavriloae / @saw_your_packet / hacktodef.com")
     print("\t- Matei Josephs / hivehack.tech\n")
 
-    # Positional argument for AMI ID (without a flag)
-    parser.add_argument("ami_id", help="AWS AMI ID to launch")
 
-    # Global arguments
+def add_auth_arguments(parser):
     auth_group = parser.add_mutually_exclusive_group()
     auth_group.add_argument("--profile", help="AWS CLI profile name (Default is 'default')", default="default")
     auth_group.add_argument("--access-key", help="AWS Access Key ID (Default profile will be used if access keys not provided)")
@@ -24,6 +22,18 @@ def parse_args():
     parser.add_argument("--secret-key", help="AWS Secret Access Key")
     parser.add_argument("--session-token", help="AWS Session Token (optional)")
 
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    print_banner()
+
+    # Positional argument for AMI ID (without a flag)
+    parser.add_argument("ami_id", help="AWS AMI ID to launch")
+
+    # Global arguments
+    add_auth_arguments(parser)
+
     parser.add_argument("--region", help="AWS Region", default="us-east-1")
 
     parser.add_argument("--bucket", help="S3 Bucket name to upload and download auxiliary scripts (Bucket will be created if doesn't already exist in your account)", required=True)
@@ -31,6 +41,21 @@ def parse_args():
     return parser.parse_args()
 
 
+def parse_reap_args():
+    parser = argparse.ArgumentParser(prog="cloudshovel reap", description="Delete CloudShovel instances, volumes and instance profiles left behind by previous runs")
+
+    print_banner()
+
+    add_auth_arguments(parser)
+
+    parser.add_argument("--region", help="AWS Region used for the API calls that are not regional", default="us-east-1")
+    parser.add_argument("--regions", nargs="+", help="AWS Regions to search for resources (Default is all the regions enabled in the account)")
+    parser.add_argument("--min-age", type=int, default=60, help="Minimum age in minutes of the resources not found in the run journal before they are deleted (Default is 60)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the resources that would be deleted")
+
+    return parser.parse_args(sys.argv[2:])
+
+
 def create_boto3_session(args):
     session_kwargs = {'region_name': args.region}
 
@@ -61,7 +86,22 @@ def create_boto3_session(args):
         exit()
 
 
+def main_reap():
+    args = parse_reap_args()
+
+    print(f"Regions: {' '.join(args.regions) if args.regions else 'all enabled regions'}")
+    print(f"Authentication method: { args.secret_key and args.access_key or args.profile}")
+
+    session = create_boto3_session(args)
+
+    reap(session, args.regions, args.min_age, args.dry_run)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'reap':
+        main_reap()
+        return
+
     args = parse_args()
 
     print(f"AMI ID: {args.ami_id}")
@@ -0,0 +1,158 @@
+import time
+
+# On-demand prices in USD for us-east-1. Adjust them to your region and pricing agreements.
+instance_hourly_prices = {
+    'c5.large': 0.085,
+    'c6g.large': 0.068,
+    'c3.large': 0.105,
+    't2.medium': 0.0464,
+}
+ebs_gib_month_price = 0.08
+s3_put_price = 0.005 / 1000
+hours_per_month = 730
+
+# Resources shared between all the scanned AMIs (secret searcher, tools installation, scripts upload)
+shared_record_key = 'shared'
+
+start_time = None
+# objects of the form {'ami-123456': {...}} with the usage recorded for each AMI
+records = {}
+# objects of the form {'i-123456': (record_key, instance_type, start_time)}
+running_instances = {}
+# objects of the form {'vol-123456': (record_key, size_in_gib, start_time)}
+attached_volumes = {}
+
+
+def new_record():
+    return {'InstanceSeconds': {},
+            'EbsGibHours': 0.0,
+            'GibAttached': 0,
+            'GibScanned': 0,
+            'SsmCommands': 0,
+            'S3Puts': 0,
+            'S3BytesUploaded': 0,
+            'Scanned': False}
+
+
+def get_record(ami=None):
+    global start_time
+    if start_time is None:
+        start_time = time.time()
+
+    key = ami if ami else shared_record_key
+    if key not in records:
+        records[key] = new_record()
+
+    return records[key]
+
+
+def begin_ami(ami):
+    get_record(ami)
+
+
+def finish_ami(ami, scanned):
+    record = get_record(ami)
+    record['Scanned'] = scanned
+
+    # Only the volumes of AMIs that were successfully searched count towards the scanned GiB
+    if scanned:
+        record['GibScanned'] = record['GibAttached']
+
+    # Volumes that couldn't be deleted are left to the reaper and are no longer accounted to the AMI
+    record_volumes_released([x for x, volume in attached_volumes.items() if volume[0] == ami])
+
+
+def record_instance_start(instance_id, instance_type, ami=None):
+    get_record(ami)
+    running_instances[instance_id] = (ami, instance_type, time.time())
+
+
+def record_instance_stop(instance_id):
+    # Instances can be stopped and then terminated, only the first call is accounted
+    if instance_id not in running_instances:
+        return
+
+    ami, instance_type, started = running_instances.pop(instance_id)
+    add_instance_seconds(get_record(ami), instance_type, time.time() - started)
+
+
+def add_instance_seconds(record, instance_type, seconds):
+    record['InstanceSeconds'][instance_type] = record['InstanceSeconds'].get(instance_type, 0) + seconds
+
+
+def record_volumes_attached(volumes, ami=None):
+    """volumes is a list of tuples of the form (volume_id, size_in_gib)"""
+    record = get_record(ami)
+
+    for volume_id, size in volumes:
+        attached_volumes[volume_id] = (ami, size, time.time())
+        record['GibAttached'] += size
+
+
+def record_volumes_released(volume_ids):
+    for volume_id in volume_ids:
+        if volume_id not in attached_volumes:
+            continue
+
+        ami, size, started = attached_volumes.pop(volume_id)
+        get_record(ami)['EbsGibHours'] += size * (time.time() - started) / 3600
+
+
+def record_ssm_command(ami=None):
+    get_record(ami)['SsmCommands'] += 1
+
+
+def record_s3_upload(object_count, byte_count, ami=None):
+    record = get_record(ami)
+    record['S3Puts'] += object_count
+    record['S3BytesUploaded'] += byte_count
+
+
+def estimate_cost(record):
+    instance_cost = sum([instance_hourly_prices.get(x, 0) * seconds / 3600 for x, seconds in record['InstanceSeconds'].items()])
+    ebs_cost = record['EbsGibHours'] * ebs_gib_month_price / hours_per_month
+    s3_cost = record['S3Puts'] * s3_put_price
+
+    return instance_cost + ebs_cost + s3_cost
+
+
+def get_summary():
+    """
+    Returns the usage recorded so far for each AMI, the totals, the estimated cost and the throughput.
+    Instances and volumes that are still running or attached are accounted up to the current time.
+    """
+    now = time.time()
+    summary_records = {}
+
+    for key, record in records.items():
+        summary_records[key] = dict(record, InstanceSeconds=dict(record['InstanceSeconds']))
+
+    for ami, instance_type, started in running_instances.values():
+        key = ami if ami else shared_record_key
+        add_instance_seconds(summary_records[key], instance_type, now - started)
+
+    for ami, size, started in attached_volumes.values():
+        key = ami if ami else shared_record_key
+        summary_records[key]['EbsGibHours'] += size * (now - started) / 3600
+
+    total = new_record()
+    total.pop('Scanned')
+    for record in summary_records.values():
+        record['EstimatedCost'] = estimate_cost(record)
+
+        for instance_type, seconds in record['InstanceSeconds'].items():
+            add_instance_seconds(total, instance_type, seconds)
+        for field in ['EbsGibHours', 'GibAttached', 'GibScanned', 'SsmCommands', 'S3Puts', 'S3BytesUploaded']:
+            total[field] += record[field]
+
+    total['EstimatedCost'] = estimate_cost(total)
+    scanned_amis = len([x for x in summary_records.keys() if x != shared_record_key and summary_records[x]['Scanned']])
+    elapsed_hours = (now - start_time) / 3600 if start_time else 0
+
+    return {'Records': summary_records,
+            'Total': total,
+            'ScannedAmis': scanned_amis,
+            'CostPerScannedAmi': total['EstimatedCost'] / scanned_amis if scanned_amis > 0 else None,
+            'AmisPerHour': scanned_amis / elapsed_hours if elapsed_hours > 0 else 0,
+            'GibScannedPerHour': total['GibScanned'] / elapsed_hours if elapsed_hours > 0 else 0,
+            'ElapsedSeconds': int(now - start_time) if start_time else 0}
@@ -0,0 +1,105 @@
+default_architecture = 'x86_64'
+
+# Instance types used for launching the target AMI, keyed by (architecture, virtualization type)
+launch_instance_types = {
+    ('x86_64', 'hvm'): 'c5.large',
+    ('x86_64', 'paravirtual'): 'c3.large',
+    ('i386', 'hvm'): 't2.medium',
+    ('i386', 'paravirtual'): 'c3.large',
+    ('arm64', 'hvm'): 'c6g.large',
+}
+
+# Instance types used for the secret searcher, keyed by architecture
+secret_searcher_instance_types = {
+    'x86_64': 'c5.large',
+    'arm64': 'c6g.large',
+}
+
+# Nitro based instance types can only launch AMIs with ENA support
+ena_instance_types = ['c5.large', 'c6g.large']
+
+# Instance types used for launching hvm AMIs without ENA support, keyed by architecture
+non_ena_instance_types = {
+    'x86_64': 't2.medium',
+}
+
+# Xen based instance types can't boot AMIs that require UEFI
+legacy_bios_instance_types = ['c3.large', 't2.medium']
+
+
+def classify_ami(ami_object):
+    ebs_mappings = [x['Ebs'] for x in ami_object.get('BlockDeviceMappings', []) if 'Ebs' in x]
+    architecture = ami_object.get('Architecture', default_architecture)
+
+    # AMIs registered without a boot mode use the default one for their architecture
+    default_boot_mode = 'uefi' if architecture == 'arm64' else 'legacy-bios'
+
+    return {'ImageId': ami_object['ImageId'],
+            'Architecture': architecture,
+            'VirtualizationType': ami_object.get('VirtualizationType', 'hvm'),
+            'Platform': 'windows' if ami_object.get('Platform') == 'windows' else 'linux',
+            'BootMode': ami_object.get('BootMode', default_boot_mode),
+            'EnaSupport': ami_object.get('EnaSupport', False),
+            'RootDeviceType': ami_object.get('RootDeviceType', 'ebs'),
+            'SnapshotIds': [x['SnapshotId'] for x in ebs_mappings if 'SnapshotId' in x],
+            'EncryptedSnapshots': any([x.get('Encrypted', False) for x in ebs_mappings])}
+
+
+def plan_acquisition(ami_object, restorable_snapshot_ids=()):
+    """
+    Decide how the volumes of the target AMI will be acquired:
+      - 'snapshot': volumes are created directly from the AMI snapshots, no target instance is launched
+      - 'launch': an instance is started from the AMI and its volumes are moved to the secret searcher
+      - 'skip': the AMI can't be acquired and no resources should be spent on it
+    """
+    classification = classify_ami(ami_object)
+    plan = {'ami': classification['ImageId'],
+            'classification': classification,
+            'strategy': 'skip',
+            'instanceType': None,
+            'searcherArchitecture': default_architecture,
+            'isWindows': classification['Platform'] == 'windows',
+            'reason': None}
+
+    architecture = classification['Architecture']
+    snapshot_ids = classification['SnapshotIds']
+
+    if classification['RootDeviceType'] != 'ebs':
+        plan['reason'] = f"root device type is {classification['RootDeviceType']} and has no EBS volumes to move"
+        return plan
+
+    if len(snapshot_ids) == 0:
+        plan['reason'] = 'AMI has no EBS snapshots'
+        return plan
+
+    # Access to the KMS key of encrypted snapshots can't be checked upfront, so they are never restored directly
+    if not classification['EncryptedSnapshots'] and all([x in restorable_snapshot_ids for x in snapshot_ids]):
+        # The searcher can mount volumes of any architecture, so the default one is used
+        plan['strategy'] = 'snapshot'
+        return plan
+
+    if classification['EncryptedSnapshots'] and not all([x in restorable_snapshot_ids for x in snapshot_ids]):
+        plan['reason'] = 'AMI has encrypted snapshots that are not shared with the current account'
+        return plan
+
+    instance_type = launch_instance_types.get((architecture, classification['VirtualizationType']))
+    if instance_type is None:
+        plan['reason'] = f"no supported instance type for architecture {architecture} with virtualization type {classification['VirtualizationType']}"
+        return plan
+
+    if not classification['EnaSupport'] and instance_type in ena_instance_types:
+        instance_type = non_ena_instance_types.get(architecture)
+        if instance_type is None:
+            plan['reason'] = f'AMI has no ENA support and there is no supported instance type without ENA for architecture {architecture}'
+            return plan
+
+    if classification['BootMode'] == 'uefi' and instance_type in legacy_bios_instance_types:
+        plan['reason'] = f'boot mode uefi is not supported by instance type {instance_type}'
+        return plan
+
+    plan['strategy'] = 'launch'
+    plan['instanceType'] = instance_type
+    if architecture in secret_searcher_instance_types:
+        plan['searcherArchitecture'] = architecture
+
+    return plan
@@ -3,7 +3,9 @@ import time
 from pathlib import Path
 from datetime import datetime
 from botocore.exceptions import ClientError
-from colorama import init, Fore, Style
+from cloudshovel.utils import accounting, reaper
+from cloudshovel.utils.acquisition import plan_acquisition, secret_searcher_instance_types
+from cloudshovel.utils.logger import log_success, log_warning, log_error
 
 availability_zone = 'a'
 secret_searcher_role_name = 'minimal-ssm'
@@ -27,6 +29,8 @@ s3_bucket_region = ''
 scanning_script_name = 'mount_and_dig.sh'
 install_ntfs_3g_script_name = 'install_ntfs_3g.sh'
 boto3_session = None
+# secret searcher used by the current run
+secret_searcher_instance_id = None
 
 def get_ami(ami_id, region):
     try:
@@ -121,6 +125,7 @@ def upload_script_to_bucket(script_name):
     f.close()
 
     s3.put_object(Bucket=s3_bucket_name, Body=script, Key=script_name)
+    accounting.record_s3_upload(1, len(script.encode()))
     log_success(f'Script {script_name} uploaded in bucket {s3_bucket_name}')
 
 
@@ -199,16 +204,22 @@ def wait_for_instance_status(instance_id, desired_status, region):
     log_success(f'Instance {instance_id} reached the status \'{desired_status}\'')
 
 
-def create_secret_searcher(region, instance_profile_arn):
+def create_secret_searcher(region, instance_profile_arn, architecture='x86_64'):
+    global secret_searcher_instance_id
     ec2 = boto3_session.client('ec2', region)
 
-    log_success('Checking if a secret searcher is already running in this region...')
+    log_success(f'Checking if a {architecture} secret searcher is already running in this region...')
     instances = ec2.describe_instances(Filters=[{'Name':'tag-key', 'Values':['usage']},
                                                 {'Name':'tag-value','Values':['SecretSearcher']},
+                                                {'Name':'architecture', 'Values':[architecture]},
                                                 {'Name':'instance-state-name', 'Values':['pending','running']}])
 
     if len(instances['Reservations']) > 0:
         instance_id = instances['Reservations'][0]['Instances'][0]['InstanceId']
+        accounting.record_instance_start(instance_id, instances['Reservations'][0]['Instances'][0]['InstanceType'])
+        # The searcher is recorded for this run as well, so it is not reaped while the run is in progress
+        reaper.journal_add([instance_id])
+        secret_searcher_instance_id = instance_id
 
         log_success(f'Secret searcher found: {instance_id}')
         log_success(f"Checking and waiting the instance to be in 'running' state")
@@ -219,9 +230,9 @@ def create_secret_searcher(region, instance_profile_arn):
         return instance_id
 
     log_warning('No secret searcher instance found. Starting creation process...')
-    log_success('Getting AMI for latest Amazon Linux 202* for current region...')
+    log_success(f'Getting AMI for latest Amazon Linux 202* ({architecture}) for current region...')
 
-    response = ec2.describe_images(Filters=[{'Name':'name','Values':['al202*-ami-202*-x86_64']}],
+    response = ec2.describe_images(Filters=[{'Name':'name','Values':[f'al202*-ami-202*-{architecture}']}],
                                      Owners=['amazon'])
 
     sorted_images = sorted(
@@ -233,7 +244,7 @@ def create_secret_searcher(region, instance_profile_arn):
     amazon_ami_id = sorted_images[0]['ImageId']
 
     log_success(f'Creating Secret Searcher instance based on official and most recent Amazon Image AMI {amazon_ami_id}...')
-    secret_searcher_instance = ec2.run_instances(InstanceType='c5.large',
+    secret_searcher_instance = ec2.run_instances(InstanceType=secret_searcher_instance_types[architecture],
                             Placement={'AvailabilityZone':f'{region}{availability_zone}'},
                             IamInstanceProfile ={'Arn':instance_profile_arn},
                             ImageId=amazon_ami_id,
@@ -243,6 +254,9 @@ def create_secret_searcher(region, instance_profile_arn):
                             TagSpecifications=[{'ResourceType': 'instance', 'Tags':[{'Key': 'usage', 'Value': 'SecretSearcher'}]}])
     
     instance_id = secret_searcher_instance['Instances'][0]['InstanceId']
+    reaper.journal_add([instance_id])
+    secret_searcher_instance_id = instance_id
+    accounting.record_instance_start(instance_id, secret_searcher_instance_types[architecture])
     log_success(f"Secret Searcher instance {instance_id} created. Waiting for instance to be in 'running' state...")
     
     wait_for_instance_status(instance_id, 'running', region)
@@ -266,6 +280,7 @@ def install_searching_tools(instance_id, region, is_windows=False):
                                     'commandLine': [f'bash /home/ec2-user/{install_ntfs_3g_script_name}'],
                                     'workingDirectory': ['/home/ec2-user/']
                                     })
+        accounting.record_ssm_command()
         
         log_success('Installation started. Waiting for completion...')
         waiter = ssm.get_waiter('command_executed')
@@ -284,6 +299,7 @@ def install_searching_tools(instance_id, region, is_windows=False):
     command = ssm.send_command(InstanceIds=[instance_id],
                             DocumentName='AWS-RunShellScript',
                             Parameters={'commands':[bash_command]})
+    accounting.record_ssm_command()
     
     waiter = ssm.get_waiter('command_executed')
     waiter.wait(CommandId=command['Command']['CommandId'], InstanceId=instance_id)
@@ -310,35 +326,58 @@ def get_targets(region, os='all'):
         windows_targets = [x for x in targets if 'Platform' in x]
         return windows_targets
 
-def start_instance_with_target_ami(ami_object, region, is_ena=False):
+
+def get_restorable_snapshot_ids(ami_object, region):
+    snapshot_ids = [x['Ebs']['SnapshotId'] for x in ami_object.get('BlockDeviceMappings', []) if 'SnapshotId' in x.get('Ebs', {})]
+
+    if len(snapshot_ids) == 0:
+        return []
+
     ec2 = boto3_session.client('ec2', region)
-    log_success(f"Starting EC2 instance for AMI {ami_object['ImageId']}...")
 
     try:
-        instance_type = 'c5.large'
-        if 'VirtualizationType' in ami_object and ami_object['VirtualizationType'] == 'paravirtual':
-            log_warning('VirtualizationType is paravirtual. Instance type will be changed from c5.large to c3.large')
-            instance_type = 'c3.large'
-        elif is_ena:
-            log_warning('ENA support is required. Instance type will be changed from c5.large to t2.medium and will have a public IP address.')
-            instance_type = 't2.medium'
-        
-        instance = None
-        if is_ena == False:
-            instance = ec2.run_instances(InstanceType=instance_type,
-                                    Placement={'AvailabilityZone':f'{region}{availability_zone}'},
-                                    NetworkInterfaces=[{'AssociatePublicIpAddress':False, 'DeviceIndex':0}],
-                                    MaxCount=1, MinCount=1,
-                                    ImageId=ami_object['ImageId'],
-                                    TagSpecifications=[{'ResourceType': 'instance', 'Tags':tags}])
-        else:
-            instance = ec2.run_instances(InstanceType=instance_type,
-                                    Placement={'AvailabilityZone':f'{region}{availability_zone}'},
-                                    MaxCount=1, MinCount=1,
-                                    ImageId=ami_object['ImageId'],
-                                    TagSpecifications=[{'ResourceType': 'instance', 'Tags':tags}])
-        
+        # Only snapshots that are public or shared with the current account are returned
+        response = ec2.describe_snapshots(SnapshotIds=snapshot_ids)
+        return [x['SnapshotId'] for x in response['Snapshots']]
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        if error_code not in ['InvalidSnapshot.NotFound', 'InvalidSnapshotID.Malformed']:
+            log_warning(f"Snapshots {snapshot_ids} couldn't be checked ({error_code}: {e.response['Error']['Message']}). The AMI will be launched or skipped instead of restored from snapshots")
+        return []
+
+
+def get_acquisition_plan(ami_object, region):
+    plan = plan_acquisition(ami_object, get_restorable_snapshot_ids(ami_object, region))
+    classification = plan['classification']
+
+    log_success(f"AMI {plan['ami']} classified as {classification['Platform']}/{classification['Architecture']}/{classification['VirtualizationType']}/{classification['BootMode']}")
+
+    if plan['strategy'] == 'snapshot':
+        log_success(f"AMI {plan['ami']} snapshots are accessible. Volumes will be created directly from snapshots")
+    elif plan['strategy'] == 'launch':
+        log_success(f"AMI {plan['ami']} will be launched on instance type {plan['instanceType']}")
+    else:
+        log_warning(f"AMI {plan['ami']} will be skipped: {plan['reason']}")
+
+    return plan
+
+
+def start_instance_with_target_ami(ami_object, region, instance_type='c5.large'):
+    ec2 = boto3_session.client('ec2', region)
+    log_success(f"Starting EC2 instance for AMI {ami_object['ImageId']} on instance type {instance_type}...")
+
+    try:
+        instance = ec2.run_instances(InstanceType=instance_type,
+                                Placement={'AvailabilityZone':f'{region}{availability_zone}'},
+                                NetworkInterfaces=[{'AssociatePublicIpAddress':False, 'DeviceIndex':0}],
+                                MaxCount=1, MinCount=1,
+                                ImageId=ami_object['ImageId'],
+                                TagSpecifications=[{'ResourceType': 'instance', 'Tags':tags},
+                                                   {'ResourceType': 'volume', 'Tags':tags}])
+
         instance_id = instance['Instances'][0]['InstanceId']
+        reaper.journal_add([instance_id])
+        accounting.record_instance_start(instance_id, instance_type, ami_object['ImageId'])
         log_success(f"Instance {instance_id} created. Waiting to be in 'running' state...")
 
         waiter = ec2.get_waiter('instance_running')
@@ -348,21 +387,11 @@ def start_instance_with_target_ami(ami_object, region, is_ena=False):
 
         return {"instanceId": instance_id, "ami": ami_object['ImageId']}
     except Exception as e:
-        error = 'failed '
-        if hasattr(e, 'message'):
-            error = f'{error}  {e.message}'
-        else:
-            error = f'{error}  {e}'
-
-        if '(ENA)' in error and is_ena == False:
-            log_warning(f'AMI {ami_object["ImageId"]} requires ENA support. Attempting to start the instance again with ENA support compatibility...')
-            return start_instance_with_target_ami(ami_object, region, is_ena=True)
-        else:
-            log_error(f"Something went wrong when launching instance with AMI {ami_object['ImageId']}: {str(e)}")
-            log_error("To fix this you might need to edit the script and change the instance type to be compatible with the AMIs requirements. Check instance types here: https://aws.amazon.com/ec2/instance-types/")
-            log_error("Script can't resume execution and will exit...")
-            cleanup()
-            exit()
+        log_error(f"Something went wrong when launching instance with AMI {ami_object['ImageId']}: {str(e)}")
+        log_error("To fix this you might need to change the instance types in acquisition.py to be compatible with the AMIs requirements. Check instance types here: https://aws.amazon.com/ec2/instance-types/")
+        log_error("Script can't resume execution and will exit...")
+        cleanup(region)
+        exit()
 
 def stop_instance(instance_ids, region):
     try:
@@ -373,6 +402,9 @@ def stop_instance(instance_ids, region):
         waiter = ec2.get_waiter('instance_stopped')
         waiter.wait(InstanceIds=instance_ids, WaiterConfig={'Delay':5, 'MaxAttempts':1000})
 
+        for instance_id in instance_ids:
+            accounting.record_instance_stop(instance_id)
+
     except Exception as e:
         log_error(f'Error when stopping instances {instance_ids}. Error: {str(e)}')
 
@@ -383,6 +415,7 @@ def move_volumes_and_terminate_instance(instance_id, instance_id_secret_searcher
 
     volumes = ec2.describe_volumes(Filters=[{'Name':'attachment.instance-id', 'Values':[instance_id]}])
     volume_ids = [x['VolumeId'] for x in volumes['Volumes']]
+    reaper.journal_add(volume_ids)
 
     if len(devices) < len(volume_ids):
         log_error('Target AMI has more EBS volumes than the number of supported EBS volumes that can be attached to an EC2 instance. This case is not covered by the script. Exiting...')
@@ -408,8 +441,43 @@ def move_volumes_and_terminate_instance(instance_id, instance_id_secret_searcher
     
     log_warning(f'Terminating instance {instance_id} created for target AMI...')
     ec2.terminate_instances(InstanceIds=[instance_id])
+    accounting.record_instance_stop(instance_id)
     log_success('Instance {instance_id} terminated')
 
+    attach_volumes_to_secret_searcher(volume_ids, instance_id_secret_searcher, ami, region)
+
+    return volume_ids
+
+
+def create_volumes_from_snapshots(ami_object, instance_id_secret_searcher, region):
+    ec2 = boto3_session.client('ec2', region)
+    snapshot_ids = [x['Ebs']['SnapshotId'] for x in ami_object['BlockDeviceMappings'] if 'SnapshotId' in x.get('Ebs', {})]
+
+    if len(devices) < len(snapshot_ids):
+        log_error('Target AMI has more EBS snapshots than the number of supported EBS volumes that can be attached to an EC2 instance. This case is not covered by the script. Exiting...')
+        exit()
+
+    volume_ids = []
+    for snapshot_id in snapshot_ids:
+        log_success(f'Creating volume from snapshot {snapshot_id}...')
+        volume = ec2.create_volume(SnapshotId=snapshot_id,
+                                   AvailabilityZone=f'{region}{availability_zone}',
+                                   VolumeType='gp3',
+                                   TagSpecifications=[{'ResourceType': 'volume', 'Tags':tags}])
+        volume_ids.append(volume['VolumeId'])
+        reaper.journal_add([volume['VolumeId']])
+
+    log_success("Waiting for all created volumes to be in 'available' state...")
+    waiter = ec2.get_waiter('volume_available')
+    waiter.wait(VolumeIds=volume_ids, WaiterConfig={'Delay':3, 'MaxAttempts':200})
+
+    attach_volumes_to_secret_searcher(volume_ids, instance_id_secret_searcher, ami_object['ImageId'], region)
+
+    return volume_ids
+
+
+def attach_volumes_to_secret_searcher(volume_ids, instance_id_secret_searcher, ami, region):
+    ec2 = boto3_session.client('ec2', region)
     log_success('Moving volumes to secret searching instance...')
 
     for volume_id in volume_ids:
@@ -426,7 +494,8 @@ def move_volumes_and_terminate_instance(instance_id, instance_id_secret_searcher
     waiter.wait(VolumeIds=volume_ids, WaiterConfig={'Delay':3, 'MaxAttempts':60})
     log_success('Volumes are ready to be searched')
 
-    return volume_ids
+    volumes = ec2.describe_volumes(VolumeIds=volume_ids)
+    accounting.record_volumes_attached([(x['VolumeId'], x['Size']) for x in volumes['Volumes']], ami)
 
 
 def start_digging_for_secrets(instance_id_secret_searcher, target_ami, region):
@@ -443,6 +512,7 @@ def start_digging_for_secrets(instance_id_secret_searcher, target_ami, region):
     command = ssm.send_command(InstanceIds=[instance_id_secret_searcher],
                         DocumentName='AWS-RunShellScript',
                         Parameters={'commands':[f'/home/ec2-user/{scanning_script_name} {parameter_volumes}']})
+    accounting.record_ssm_command(target_ami)
 
     log_success(f'Secret searching in {parameter_volumes} started. Waiting for completion...')
 
@@ -458,15 +528,31 @@ def upload_results(instance_id_secret_searcher, target_ami, region):
     log_success(f'Uploading results for AMI {target_ami} to S3 bucket {s3_bucket_name}...')
 
     ssm = boto3_session.client('ssm', region)
+    # The sync output is summarized on the instance since the command output returned by SSM is truncated.
+    # Only the files actually uploaded by sync are counted, the ones already present in the bucket are skipped.
+    sync_log = '/home/ec2-user/sync_output.log'
     command = ssm.send_command(InstanceIds=[instance_id_secret_searcher],
                         DocumentName='AWS-RunShellScript',
-                        Parameters={'commands':[f'aws --region {s3_bucket_region} s3 sync /home/ec2-user/OUTPUT/ s3://{s3_bucket_name}/{region}/{target_ami}/', 'rm -rf /home/ec2-user/OUTPUT/']})
+                        Parameters={'commands':[f'aws --region {s3_bucket_region} s3 sync --no-progress /home/ec2-user/OUTPUT/ s3://{s3_bucket_name}/{region}/{target_ami}/ > {sync_log}',
+                                                f"echo \"uploaded_objects: $(grep -c '^upload: ' {sync_log})\"",
+                                                f"echo \"uploaded_bytes: $(grep '^upload: ' {sync_log} | sed -e 's/^upload: //' -e 's/ to s3:\\/\\/.*$//' | xargs -r -d '\\n' stat -c %s | awk '{{s+=$1}} END {{print s+0}}')\"",
+                                                f'rm -rf /home/ec2-user/OUTPUT/ {sync_log}']})
+    accounting.record_ssm_command(target_ami)
     
     log_success(f'Upload started. Waiting for upload to complete (this might take a while)...')
     waiter = ssm.get_waiter('command_executed')
     waiter.wait(CommandId=command['Command']['CommandId'], InstanceId=instance_id_secret_searcher, WaiterConfig={'Delay':5, 'MaxAttempts':800})
     log_success(f'Upload completed')
 
+    output = ssm.get_command_invocation(CommandId=command['Command']['CommandId'], InstanceId=instance_id_secret_searcher)
+    uploaded = {}
+    for line in output['StandardOutputContent'].splitlines():
+        if line.startswith('uploaded_'):
+            key, value = line.split(':', 1)
+            uploaded[key] = int(value.strip() or 0)
+
+    accounting.record_s3_upload(uploaded.get('uploaded_objects', 0), uploaded.get('uploaded_bytes', 0), target_ami)
+
     
 def delete_volumes(volume_ids, region):
     log_success(f'Starting deleting volumes {volume_ids} procedure...')
@@ -484,26 +570,32 @@ def delete_volumes(volume_ids, region):
     log_warning(f'Deleting volumes {volume_ids}')
     for volume_id in volume_ids:
         ec2.delete_volume(VolumeId=volume_id)
+
+    accounting.record_volumes_released(volume_ids)
     
-    log_warning("All volumes were set for deletion. The script doesn't wait for deletion confirmation. Please check manually if everything was deleted.")
+    log_warning("All volumes were set for deletion. The script doesn't wait for deletion confirmation. Volumes left behind can be deleted with 'cloudshovel reap'.")
 
 
 def cleanup(region):
     log_warning('Starting cleanup (the S3 bucket will not be deleted)...')
     ec2 = boto3_session.client('ec2', region)
 
-    log_success('Deleting EC2 secret searcher instance...')
-    instances = ec2.describe_instances(Filters=[{'Name':'tag-key', 'Values':['usage']},
-                                                {'Name':'tag-value','Values':['SecretSearcher']},
-                                                {'Name':'instance-state-name', 'Values':['pending','running']}])
+    # Resources used by other runs in progress are left to the reaper
+    other_runs_resources = reaper.get_other_active_resources()
 
-    if len(instances['Reservations']) == 0:
-        log_warning('No secret searcher instance found. Continuing with next resource')
+    log_success('Deleting EC2 secret searcher instance...')
+    if secret_searcher_instance_id is None:
+        log_warning('No secret searcher instance was used by this run. Continuing with next resource')
+    elif secret_searcher_instance_id in other_runs_resources:
+        log_warning(f'Secret searcher {secret_searcher_instance_id} is used by other runs in progress and will not be terminated')
     else:
-        # should be only one instance, but just to be sure
-        instance_ids = [x['InstanceId'] for x in instances['Reservations'][0]['Instances']]
-        log_success(f'Terminating instances: {instance_ids}')
-        ec2.terminate_instances(InstanceIds=instance_ids)
+        log_success(f'Terminating instance: {secret_searcher_instance_id}')
+        ec2.terminate_instances(InstanceIds=[secret_searcher_instance_id])
+        accounting.record_instance_stop(secret_searcher_instance_id)
+
+    if len(other_runs_resources) > 0:
+        log_warning(f'Other runs are in progress. Role and instance profile {secret_searcher_role_name} will not be deleted')
+        return
 
     iam = boto3_session.client('iam')
     
@@ -517,22 +609,32 @@ def cleanup(region):
         log_success('Role and instance profile deleted')
     except ClientError as e:
         if e.response['Error']['Code'] != 'NoSuchEntity':
-            log_error(f'Unknown error: {e["Error"]["Code"]}. Exiting...')
+            log_error(f'Unknown error: {e.response["Error"]["Code"]}. Exiting...')
             exit()
         else:
             log_success(f'No role {secret_searcher_role_name} found.')
 
 
-init()  # Initialize colorama
+def log_accounting_summary():
+    summary = accounting.get_summary()
+
+    if len(summary['Records']) == 0:
+        return
 
-def log_success(message):
-    print(f"{Fore.GREEN}[INFO]{Style.RESET_ALL} {message}")
+    log_success('Accounting summary (costs are estimated using the price table from accounting.py):')
+    for key, record in summary['Records'].items():
+        instance_time = ', '.join([f'{x} {int(seconds)}s' for x, seconds in record['InstanceSeconds'].items()]) or 'none'
+        log_success(f"  {key}: instance time {instance_time}, "
+                    f"EBS {record['EbsGibHours']:.3f} GiB-hours ({record['GibAttached']} GiB attached, {record['GibScanned']} GiB scanned), "
+                    f"{record['SsmCommands']} SSM commands, "
+                    f"{record['S3Puts']} S3 PUTs ({record['S3BytesUploaded']} bytes), "
+                    f"estimated cost ${record['EstimatedCost']:.4f}")
 
-def log_warning(message):
-    print(f"{Fore.YELLOW}[WARN]{Style.RESET_ALL} {message}")
+    log_success(f"  Total estimated cost: ${summary['Total']['EstimatedCost']:.4f} for {summary['ScannedAmis']} scanned AMIs in {summary['ElapsedSeconds']} seconds")
+    if summary['CostPerScannedAmi'] is not None:
+        log_success(f"  Estimated cost per scanned AMI: ${summary['CostPerScannedAmi']:.4f}")
+    log_success(f"  Throughput: {summary['AmisPerHour']:.2f} AMIs/hour, {summary['GibScannedPerHour']:.2f} GiB scanned/hour")
 
-def log_error(message):
-    print(f"{Fore.RED}[ERROR]{Style.RESET_ALL} {message}")
 
 def dig(args, session):
     global boto3_session
@@ -544,27 +646,39 @@ def dig(args, session):
     start_scan_time = time.time()
     volume_ids = []
 
+    accounting.begin_ami(args.ami_id)
+    reaper.start_run(args.ami_id, region)
+
     try:
         log_warning("If ran in an EC2 instance, make sure it has the required permissions to execute the tool")
         target_ami = get_ami(args.ami_id, region)
 
+        plan = get_acquisition_plan(target_ami, region)
+        if plan['strategy'] == 'skip':
+            log_error(f"AMI {plan['ami']} can't be scanned: {plan['reason']}. Exiting...")
+            return
+
         instance_profile_arn_secret_searcher = get_instance_profile_secret_searcher(region)
-        instance_id_secret_searcher = create_secret_searcher(region, instance_profile_arn_secret_searcher)
+        instance_id_secret_searcher = create_secret_searcher(region, instance_profile_arn_secret_searcher, plan['searcherArchitecture'])
         create_s3_bucket(region)
         upload_script_to_bucket(scanning_script_name)
 
-        is_windows = 'Platform' in target_ami and target_ami['Platform'] == 'windows'
+        is_windows = plan['isWindows']
         if is_windows:
             upload_script_to_bucket(install_ntfs_3g_script_name)
 
         install_searching_tools(instance_id_secret_searcher, region, is_windows)
 
-        instance = start_instance_with_target_ami(target_ami, region)
-        stop_instance([instance['instanceId']], region)
+        if plan['strategy'] == 'snapshot':
+            volume_ids = create_volumes_from_snapshots(target_ami, instance_id_secret_searcher, region)
+        else:
+            instance = start_instance_with_target_ami(target_ami, region, plan['instanceType'])
+            stop_instance([instance['instanceId']], region)
+
+            volume_ids = move_volumes_and_terminate_instance(instance['instanceId'], instance_id_secret_searcher, instance['ami'], region)
 
-        volume_ids = move_volumes_and_terminate_instance(instance['instanceId'], instance_id_secret_searcher, instance['ami'], region)
         start_scan_time = time.time()
-        start_digging_for_secrets(instance_id_secret_searcher, instance['ami'], region)
+        start_digging_for_secrets(instance_id_secret_searcher, target_ami['ImageId'], region)
         
         searched = True
         delete_volumes(volume_ids, region)
@@ -576,13 +690,21 @@ def dig(args, session):
         if searched == False and len(volume_ids) > 0:
             delete_volumes(volume_ids, region)
         elif len(volume_ids) > 0:
-            log_error("An error occurred while deleting the volumes. Please check manually what happened.")
+            log_error("An error occurred while deleting the volumes. They will be deleted by the reaper at the end of the run.")
     else:
-        upload_results(instance_id_secret_searcher, instance['ami'], region)
+        upload_results(instance_id_secret_searcher, target_ami['ImageId'], region)
         log_success(f"Total duration for ami {target_ami['ImageId']}: {int((time.time() - start_scan_time))} seconds")
         log_success(f'Scan finished. Check results in s3://{s3_bucket_name}')
     finally:
         cleanup(region)
+        accounting.finish_ami(args.ami_id, searched)
+
+        try:
+            reaper.reap_run(boto3_session, region)
+        except Exception as e:
+            log_error(f"Resources left behind by this run couldn't be deleted: {e}. Run 'cloudshovel reap' to delete them.")
+
+        log_accounting_summary()
             
 
 if __name__ == '__main__':
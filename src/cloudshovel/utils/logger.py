@@ -0,0 +1,12 @@
+from colorama import init, Fore, Style
+
+init()  # Initialize colorama
+
+def log_success(message):
+    print(f"{Fore.GREEN}[INFO]{Style.RESET_ALL} {message}")
+
+def log_warning(message):
+    print(f"{Fore.YELLOW}[WARN]{Style.RESET_ALL} {message}")
+
+def log_error(message):
+    print(f"{Fore.RED}[ERROR]{Style.RESET_ALL} {message}")
@@ -0,0 +1,371 @@
+import os
+import json
+import time
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from cloudshovel.utils.logger import log_success, log_warning, log_error
+
+usage_tag_values = ['CloudQuarry', 'SecretSearcher']
+# Each run is recorded in its own file, written only by the process running it
+runs_path = Path.home() / '.cloudshovel' / 'runs'
+# Runs that didn't finish after this interval (in seconds) are considered crashed and their resources can be reaped
+max_run_duration = 12 * 3600
+# Maximum number of values in a describe filter and of instances terminated with a single call
+batch_size = 200
+max_workers = 16
+
+current_run = None
+
+
+def load_journal():
+    """Returns the runs recorded in the journal, keyed by run id"""
+    journal = {}
+    if not runs_path.exists():
+        return journal
+
+    for run_file in runs_path.glob('*.json'):
+        try:
+            with open(run_file) as f:
+                journal[run_file.stem] = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            log_warning(f'Run journal entry {run_file} could not be read ({e}). Its resources will be checked only by age')
+
+    return journal
+
+
+def save_run():
+    run_file = runs_path / f"{current_run['id']}.json"
+    temp_file = runs_path / f"{current_run['id']}.tmp"
+
+    try:
+        runs_path.mkdir(parents=True, exist_ok=True)
+        with open(temp_file, 'w') as f:
+            f.write(json.dumps(current_run, indent=2))
+        # The file is replaced at once, so other processes never read a partially written run
+        os.replace(temp_file, run_file)
+    except OSError as e:
+        log_warning(f'Run journal entry {run_file} could not be saved: {e}')
+
+
+def prune_journal(journal):
+    """Removes the runs that are no longer active and were started more than max_run_duration ago"""
+    for run_id, run in journal.items():
+        if is_run_active(run) or time.time() - run['started'] < max_run_duration:
+            continue
+
+        try:
+            (runs_path / f'{run_id}.json').unlink()
+        except OSError as e:
+            log_warning(f'Run journal entry {run_id} could not be removed: {e}')
+
+
+def start_run(ami_id, region):
+    global current_run
+    prune_journal(load_journal())
+
+    current_run = {'id': f'{ami_id}-{int(time.time() * 1000)}-{os.getpid()}',
+                   'region': region,
+                   'started': time.time(),
+                   'finished': None,
+                   'resources': []}
+    save_run()
+
+
+def journal_add(resource_ids):
+    if current_run is None:
+        return
+
+    current_run['resources'].extend(resource_ids)
+    save_run()
+
+
+def finish_run():
+    global current_run
+    if current_run is None:
+        return
+
+    current_run['finished'] = time.time()
+    save_run()
+    current_run = None
+
+
+def is_run_active(run):
+    return run['finished'] is None and time.time() - run['started'] < max_run_duration
+
+
+def get_journal_resources(journal, excluded_run_id=None):
+    """Returns the resources of the runs in progress and the resources of the finished or crashed runs"""
+    active = set()
+    inactive = set()
+
+    for run_id, run in journal.items():
+        if run_id == excluded_run_id:
+            continue
+
+        if is_run_active(run):
+            active.update(run['resources'])
+        else:
+            inactive.update(run['resources'])
+
+    return active, inactive
+
+
+def get_other_active_resources():
+    """Returns the resources of the runs in progress, except the current one"""
+    excluded_run_id = current_run['id'] if current_run is not None else None
+    return get_journal_resources(load_journal(), excluded_run_id)[0]
+
+
+def chunks(items, size=batch_size):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def find_instances(ec2):
+    paginator = ec2.get_paginator('describe_instances')
+    instances = []
+
+    for page in paginator.paginate(Filters=[{'Name':'tag:usage', 'Values':usage_tag_values},
+                                            {'Name':'instance-state-name', 'Values':['pending', 'running', 'shutting-down', 'stopping', 'stopped']}],
+                                   PaginationConfig={'PageSize': 500}):
+        for reservation in page['Reservations']:
+            instances.extend(reservation['Instances'])
+
+    return instances
+
+
+def find_volumes(ec2, instance_ids=(), volume_ids=(), states=('available', 'in-use')):
+    """Returns the CloudShovel volumes, the volumes attached to the given instances and the given volumes"""
+    paginator = ec2.get_paginator('describe_volumes')
+    status_filter = {'Name':'status', 'Values':list(states)}
+    filters = [[{'Name':'tag:usage', 'Values':usage_tag_values}, status_filter]]
+    filters.extend([[{'Name':'attachment.instance-id', 'Values':x}, status_filter] for x in chunks(instance_ids)])
+    # Filtering by id doesn't fail for the volumes that were already deleted
+    filters.extend([[{'Name':'volume-id', 'Values':x}, status_filter] for x in chunks(volume_ids)])
+    volumes = {}
+
+    for volume_filters in filters:
+        for page in paginator.paginate(Filters=volume_filters, PaginationConfig={'PageSize': 500}):
+            for volume in page['Volumes']:
+                volumes[volume['VolumeId']] = volume
+
+    return list(volumes.values())
+
+
+def delete_volume(ec2, volume_id):
+    try:
+        ec2.delete_volume(VolumeId=volume_id)
+        return True
+    except ClientError as e:
+        log_error(f'Volume {volume_id} could not be deleted: {e.response["Error"]["Message"]}')
+        return False
+
+
+def terminate_instances(ec2, instance_ids):
+    try:
+        ec2.terminate_instances(InstanceIds=instance_ids)
+        return len(instance_ids)
+    except ClientError as e:
+        log_error(f'Instances {instance_ids} could not be terminated: {e.response["Error"]["Message"]}')
+        return 0
+
+
+def reap_region(ec2, region, should_reap, dry_run=False):
+    """
+    Terminates the CloudShovel instances and deletes the CloudShovel volumes from a region.
+    should_reap receives the resource id and its creation time and decides if the resource is deleted.
+    Returns the number of instances and volumes deleted, the number of resources kept and if the region failed.
+    """
+    result = {'region': region, 'instances': 0, 'volumes': 0, 'kept': 0, 'failed': False}
+
+    try:
+        reap_region_resources(ec2, region, should_reap, dry_run, result)
+    except (BotoCoreError, ClientError) as e:
+        log_error(f'[{region}] Resources could not be reaped: {e}')
+        result['failed'] = True
+
+    return result
+
+
+def reap_region_resources(ec2, region, should_reap, dry_run, result):
+    instances = find_instances(ec2)
+    instance_ids = [x['InstanceId'] for x in instances if should_reap(x['InstanceId'], x['LaunchTime'])]
+    result['kept'] += len(instances) - len(instance_ids)
+    # Instances already shutting down are only waited for, in case they still have volumes attached
+    to_terminate = [x['InstanceId'] for x in instances if x['InstanceId'] in instance_ids and x['State']['Name'] != 'shutting-down']
+    # Volumes deleted on termination go away with the reaped instances (e.g. the root volume of the secret searcher)
+    deleted_on_termination = set([y['Ebs']['VolumeId'] for x in instances if x['InstanceId'] in instance_ids
+                                  for y in x.get('BlockDeviceMappings', []) if y.get('Ebs', {}).get('DeleteOnTermination')])
+
+    volume_ids = []
+    attached_to = set()
+    for volume in find_volumes(ec2, instance_ids):
+        attachments = volume.get('Attachments', [])
+
+        if len(attachments) == 0:
+            if should_reap(volume['VolumeId'], volume['CreateTime']):
+                volume_ids.append(volume['VolumeId'])
+            else:
+                result['kept'] += 1
+        elif all([x['InstanceId'] in instance_ids for x in attachments]):
+            # The other volumes of the reaped instances are deleted once the instances are terminated
+            if volume['VolumeId'] not in deleted_on_termination:
+                volume_ids.append(volume['VolumeId'])
+                attached_to.update([x['InstanceId'] for x in attachments])
+        else:
+            result['kept'] += 1
+
+    if len(to_terminate) == 0 and len(volume_ids) == 0:
+        return
+
+    log_warning(f'[{region}] Instances to terminate: {to_terminate}')
+    log_warning(f'[{region}] Volumes to delete: {volume_ids}')
+
+    if dry_run:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        result['instances'] = sum(executor.map(lambda x: terminate_instances(ec2, x), chunks(to_terminate)))
+
+    # Volumes attached to the terminated instances become available only after the termination
+    if len(attached_to) > 0:
+        log_success(f'[{region}] Waiting for instances {list(attached_to)} to be terminated...')
+        waiter = ec2.get_waiter('instance_terminated')
+        for batch in chunks(attached_to):
+            try:
+                waiter.wait(InstanceIds=batch, WaiterConfig={'Delay': 5, 'MaxAttempts': 120})
+            except Exception as e:
+                log_error(f'[{region}] Instances {batch} were not terminated in time: {e}')
+
+        volume_ids = [x['VolumeId'] for x in find_volumes(ec2, volume_ids=volume_ids, states=['available']) if x['VolumeId'] in volume_ids]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        result['volumes'] = sum(executor.map(lambda x: delete_volume(ec2, x), volume_ids))
+
+
+def has_usage_tag(response_tags):
+    return any([x['Key'] == 'usage' and x['Value'] in usage_tag_values for x in response_tags])
+
+
+def is_instance_profile_tagged(iam, profile_name):
+    # Tags are not returned when listing the instance profiles
+    try:
+        response = iam.get_instance_profile(InstanceProfileName=profile_name)
+        return has_usage_tag(response['InstanceProfile'].get('Tags', []))
+    except ClientError as e:
+        log_error(f'Tags of instance profile {profile_name} could not be retrieved: {e.response["Error"]["Message"]}')
+        return False
+
+
+def reap_instance_profiles(iam, should_reap, dry_run=False):
+    paginator = iam.get_paginator('list_instance_profiles')
+    profiles = []
+
+    for page in paginator.paginate():
+        profiles.extend(page['InstanceProfiles'])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tagged = list(executor.map(lambda x: is_instance_profile_tagged(iam, x['InstanceProfileName']), profiles))
+
+    profiles = [x for x, is_tagged in zip(profiles, tagged) if is_tagged and should_reap(x['InstanceProfileName'], x['CreateDate'])]
+
+    if len(profiles) == 0:
+        return 0
+
+    log_warning(f"Instance profiles to delete: {[x['InstanceProfileName'] for x in profiles]}")
+    if dry_run:
+        return 0
+
+    deleted = 0
+    for profile in profiles:
+        try:
+            for role in profile['Roles']:
+                iam.remove_role_from_instance_profile(InstanceProfileName=profile['InstanceProfileName'], RoleName=role['RoleName'])
+
+                if not has_usage_tag(iam.get_role(RoleName=role['RoleName'])['Role'].get('Tags', [])):
+                    continue
+
+                for policy in iam.list_attached_role_policies(RoleName=role['RoleName'])['AttachedPolicies']:
+                    iam.detach_role_policy(RoleName=role['RoleName'], PolicyArn=policy['PolicyArn'])
+                iam.delete_role(RoleName=role['RoleName'])
+
+            iam.delete_instance_profile(InstanceProfileName=profile['InstanceProfileName'])
+            deleted += 1
+        except ClientError as e:
+            log_error(f"Instance profile {profile['InstanceProfileName']} could not be deleted: {e.response['Error']['Message']}")
+
+    return deleted
+
+
+def get_regions(session):
+    ec2 = session.client('ec2')
+    return [x['RegionName'] for x in ec2.describe_regions()['Regions']]
+
+
+def reap(session, regions=None, min_age_minutes=60, dry_run=False):
+    """
+    Deletes the CloudShovel instances, volumes and instance profiles left behind by previous runs.
+    Resources of runs in progress are kept, resources of finished runs are deleted and
+    resources not found in the run journal are deleted if they are older than min_age_minutes.
+    """
+    if not regions:
+        regions = get_regions(session)
+
+    active, inactive = get_journal_resources(load_journal())
+    threshold = datetime.now(timezone.utc) - timedelta(minutes=min_age_minutes)
+
+    def should_reap(resource_id, created):
+        if resource_id in active:
+            return False
+        return resource_id in inactive or created < threshold
+
+    log_success(f'Searching for CloudShovel resources in regions {regions}...')
+
+    # boto3 sessions are not thread safe, so the clients are created before starting the threads
+    clients = [(session.client('ec2', region_name=x), x) for x in regions]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda x: reap_region(x[0], x[1], should_reap, dry_run), clients))
+
+    failed_regions = [x['region'] for x in results if x['failed']]
+
+    # The instance profile is shared by all the runs and is kept while any of them is in progress
+    profiles = 0
+    if len(failed_regions) > 0:
+        log_warning(f'Regions {failed_regions} could not be checked. Instance profiles will not be deleted')
+    elif len(active) > 0 or sum([x['kept'] for x in results]) > 0:
+        log_warning('Some CloudShovel resources are still in use. Instance profiles will not be deleted')
+    else:
+        try:
+            profiles = reap_instance_profiles(session.client('iam'), should_reap, dry_run)
+        except (BotoCoreError, ClientError) as e:
+            log_error(f'Instance profiles could not be reaped: {e}')
+
+    summary = {'instances': sum([x['instances'] for x in results]),
+               'volumes': sum([x['volumes'] for x in results]),
+               'instance_profiles': profiles,
+               'kept': sum([x['kept'] for x in results]),
+               'failed_regions': failed_regions}
+
+    if dry_run:
+        log_success('Dry run finished. No resource was deleted')
+    else:
+        log_success(f"Reaper finished: {summary['instances']} instances terminated, {summary['volumes']} volumes deleted, "
+                    f"{summary['instance_profiles']} instance profiles deleted, {summary['kept']} resources kept")
+
+    return summary
+
+
+def reap_run(session, region):
+    """Deletes whatever is left from the current run, regardless of its age, and marks the run as finished"""
+    if current_run is None:
+        return
+
+    if len(current_run['resources']) > 0:
+        # Resources shared with other runs in progress (e.g. a reused secret searcher) are kept
+        resources = set(current_run['resources']) - get_other_active_resources()
+        log_success('Checking for resources left behind by this run...')
+        reap_region(session.client('ec2', region_name=region), region, lambda resource_id, created: resource_id in resources)
+
+    finish_run()
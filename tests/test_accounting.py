@@ -0,0 +1,130 @@
+import pytest
+
+from cloudshovel.utils import accounting
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(accounting, 'start_time', None)
+    monkeypatch.setattr(accounting, 'records', {})
+    monkeypatch.setattr(accounting, 'running_instances', {})
+    monkeypatch.setattr(accounting, 'attached_volumes', {})
+
+    fake_clock = Clock()
+    monkeypatch.setattr(accounting.time, 'time', fake_clock)
+    return fake_clock
+
+
+def test_stopped_then_terminated_instance_is_counted_once(clock):
+    accounting.record_instance_start('i-1', 'c5.large', 'ami-1')
+    clock.advance(100)
+    accounting.record_instance_stop('i-1')
+    clock.advance(50)
+    accounting.record_instance_stop('i-1')
+
+    summary = accounting.get_summary()
+
+    assert summary['Records']['ami-1']['InstanceSeconds'] == {'c5.large': 100}
+
+
+def test_running_instances_are_counted_up_to_now(clock):
+    accounting.record_instance_start('i-1', 'c5.large')
+    clock.advance(30)
+
+    summary = accounting.get_summary()
+
+    assert summary['Records']['shared']['InstanceSeconds'] == {'c5.large': 30}
+    # Summaries don't modify the recorded usage
+    assert accounting.records['shared']['InstanceSeconds'] == {}
+
+
+def test_released_and_attached_volumes(clock):
+    accounting.record_volumes_attached([('vol-1', 10), ('vol-2', 20)], 'ami-1')
+    clock.advance(3600)
+    accounting.record_volumes_released(['vol-1'])
+    clock.advance(3600)
+
+    summary = accounting.get_summary()
+
+    # vol-1 was released after 1 hour, vol-2 is still attached after 2 hours
+    assert summary['Records']['ami-1']['EbsGibHours'] == pytest.approx(10 + 40)
+    assert summary['Records']['ami-1']['GibAttached'] == 30
+
+
+def test_finish_ami_stops_volume_accrual(clock):
+    accounting.record_volumes_attached([('vol-1', 10)], 'ami-1')
+    clock.advance(3600)
+    accounting.finish_ami('ami-1', scanned=False)
+    clock.advance(3600)
+
+    summary = accounting.get_summary()
+
+    assert summary['Records']['ami-1']['EbsGibHours'] == pytest.approx(10)
+
+
+def test_only_scanned_amis_count_towards_scanned_gib(clock):
+    accounting.record_volumes_attached([('vol-1', 100)], 'ami-failed')
+    accounting.finish_ami('ami-failed', scanned=False)
+    accounting.record_volumes_attached([('vol-2', 8)], 'ami-scanned')
+    accounting.finish_ami('ami-scanned', scanned=True)
+    clock.advance(3600)
+
+    summary = accounting.get_summary()
+
+    assert summary['Total']['GibAttached'] == 108
+    assert summary['Total']['GibScanned'] == 8
+    assert summary['ScannedAmis'] == 1
+    assert summary['AmisPerHour'] == pytest.approx(1)
+    assert summary['GibScannedPerHour'] == pytest.approx(8)
+
+
+def test_cost_per_scanned_ami_is_none_without_scans(clock):
+    accounting.begin_ami('ami-1')
+    accounting.finish_ami('ami-1', scanned=False)
+
+    summary = accounting.get_summary()
+
+    assert summary['ScannedAmis'] == 0
+    assert summary['CostPerScannedAmi'] is None
+    assert summary['AmisPerHour'] == 0
+
+
+def test_estimated_cost_includes_shared_usage(clock):
+    accounting.record_instance_start('i-searcher', 'c5.large')
+    accounting.record_instance_start('i-target', 't2.medium', 'ami-1')
+    accounting.record_volumes_attached([('vol-1', 730)], 'ami-1')
+    accounting.record_s3_upload(1000, 2048, 'ami-1')
+    accounting.record_ssm_command('ami-1')
+    clock.advance(3600)
+    accounting.record_instance_stop('i-searcher')
+    accounting.record_instance_stop('i-target')
+    accounting.finish_ami('ami-1', scanned=True)
+
+    summary = accounting.get_summary()
+
+    ami_cost = accounting.instance_hourly_prices['t2.medium'] + accounting.ebs_gib_month_price + 1000 * accounting.s3_put_price
+    shared_cost = accounting.instance_hourly_prices['c5.large']
+    assert summary['Records']['ami-1']['EstimatedCost'] == pytest.approx(ami_cost)
+    assert summary['Records']['shared']['EstimatedCost'] == pytest.approx(shared_cost)
+    assert summary['Total']['EstimatedCost'] == pytest.approx(ami_cost + shared_cost)
+    assert summary['Total']['InstanceSeconds'] == {'c5.large': 3600, 't2.medium': 3600}
+    assert summary['Total']['SsmCommands'] == 1
+    assert summary['CostPerScannedAmi'] == pytest.approx(ami_cost + shared_cost)
+
+
+def test_unknown_instance_types_have_no_cost():
+    record = accounting.new_record()
+    record['InstanceSeconds'] = {'x1.unknown': 3600}
+
+    assert accounting.estimate_cost(record) == 0
@@ -0,0 +1,67 @@
+import pytest
+
+from cloudshovel.utils.acquisition import plan_acquisition
+
+
+def ami(snapshots=(('snap-1', False),), **attributes):
+    ami_object = {'ImageId': 'ami-12345678',
+                  'Architecture': 'x86_64',
+                  'VirtualizationType': 'hvm',
+                  'RootDeviceType': 'ebs',
+                  'EnaSupport': True,
+                  'BlockDeviceMappings': [{'DeviceName': f'/dev/sd{chr(97 + i)}', 'Ebs': {'SnapshotId': x, 'Encrypted': encrypted}}
+                                          for i, (x, encrypted) in enumerate(snapshots)]}
+    ami_object.update(attributes)
+    return ami_object
+
+
+@pytest.mark.parametrize('ami_object, restorable, strategy, instance_type, searcher_architecture', [
+    (ami(), (), 'launch', 'c5.large', 'x86_64'),
+    (ami(Architecture='arm64'), (), 'launch', 'c6g.large', 'arm64'),
+    (ami(VirtualizationType='paravirtual'), (), 'launch', 'c3.large', 'x86_64'),
+    (ami(EnaSupport=False), (), 'launch', 't2.medium', 'x86_64'),
+    (ami(Architecture='i386', EnaSupport=False), (), 'launch', 't2.medium', 'x86_64'),
+    (ami(Platform='windows'), (), 'launch', 'c5.large', 'x86_64'),
+    (ami(BootMode='uefi'), (), 'launch', 'c5.large', 'x86_64'),
+    (ami(), ('snap-1',), 'snapshot', None, 'x86_64'),
+    (ami(Architecture='arm64', EnaSupport=False), ('snap-1',), 'snapshot', None, 'x86_64'),
+    (ami(snapshots=[('snap-1', True)]), ('snap-1',), 'launch', 'c5.large', 'x86_64'),
+    (ami(snapshots=[('snap-1', False), ('snap-2', False)]), ('snap-1',), 'launch', 'c5.large', 'x86_64'),
+])
+def test_acquired_amis(ami_object, restorable, strategy, instance_type, searcher_architecture):
+    plan = plan_acquisition(ami_object, restorable)
+
+    assert plan['strategy'] == strategy
+    assert plan['instanceType'] == instance_type
+    assert plan['searcherArchitecture'] == searcher_architecture
+    assert plan['reason'] is None
+
+
+@pytest.mark.parametrize('ami_object, restorable, reason', [
+    (ami(RootDeviceType='instance-store'), (), 'root device type is instance-store'),
+    (ami(snapshots=[]), (), 'no EBS snapshots'),
+    (ami(snapshots=[('snap-1', True)]), (), 'encrypted snapshots that are not shared'),
+    (ami(Architecture='arm64', EnaSupport=False), (), 'no ENA support'),
+    (ami(Architecture='arm64', VirtualizationType='paravirtual'), (), 'no supported instance type'),
+    (ami(Architecture='x86_64_mac'), (), 'no supported instance type'),
+    (ami(EnaSupport=False, BootMode='uefi'), (), 'uefi is not supported by instance type t2.medium'),
+    (ami(VirtualizationType='paravirtual', BootMode='uefi'), (), 'uefi is not supported by instance type c3.large'),
+])
+def test_skipped_amis(ami_object, restorable, reason):
+    plan = plan_acquisition(ami_object, restorable)
+
+    assert plan['strategy'] == 'skip'
+    assert plan['instanceType'] is None
+    assert reason in plan['reason']
+
+
+def test_ami_without_boot_mode_uses_the_architecture_default():
+    plan = plan_acquisition(ami(Architecture='arm64'))
+
+    assert plan['classification']['BootMode'] == 'uefi'
+    assert plan_acquisition(ami())['classification']['BootMode'] == 'legacy-bios'
+
+
+def test_windows_ami_is_flagged():
+    assert plan_acquisition(ami(Platform='windows'))['isWindows']
+    assert not plan_acquisition(ami())['isWindows']
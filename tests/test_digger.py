@@ -0,0 +1,88 @@
+import boto3
+import moto
+import pytest
+
+from cloudshovel.utils import digger, reaper
+
+region = 'us-east-1'
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(reaper, 'runs_path', tmp_path / 'runs')
+    monkeypatch.setattr(reaper, 'current_run', None)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'testing')
+
+    with moto.mock_aws():
+        session = boto3.Session(region_name=region)
+        monkeypatch.setattr(digger, 'boto3_session', session)
+        monkeypatch.setattr(digger, 'secret_searcher_instance_id', None)
+        yield session
+
+
+def launch_secret_searcher(ec2):
+    image_id = ec2.describe_images(Owners=['amazon'])['Images'][0]['ImageId']
+    instance = ec2.run_instances(ImageId=image_id, MinCount=1, MaxCount=1,
+                                 TagSpecifications=[{'ResourceType': 'instance', 'Tags': [{'Key': 'usage', 'Value': 'SecretSearcher'}]}])
+    return instance['Instances'][0]['InstanceId']
+
+
+def create_instance_profile(iam):
+    iam.create_role(RoleName=digger.secret_searcher_role_name, AssumeRolePolicyDocument='{}', Tags=digger.tags)
+    iam.create_instance_profile(InstanceProfileName=digger.secret_searcher_role_name, Tags=digger.tags)
+    iam.add_role_to_instance_profile(InstanceProfileName=digger.secret_searcher_role_name, RoleName=digger.secret_searcher_role_name)
+
+
+def instance_state(ec2, instance_id):
+    return ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]['State']['Name']
+
+
+def test_cleanup_terminates_only_the_searcher_of_the_run(session, monkeypatch):
+    ec2 = session.client('ec2')
+    own_searcher_id = launch_secret_searcher(ec2)
+    other_searcher_id = launch_secret_searcher(ec2)
+    monkeypatch.setattr(digger, 'secret_searcher_instance_id', own_searcher_id)
+    reaper.start_run('ami-00000001', region)
+    reaper.journal_add([own_searcher_id])
+
+    digger.cleanup(region)
+
+    assert instance_state(ec2, own_searcher_id) == 'terminated'
+    assert instance_state(ec2, other_searcher_id) == 'running'
+
+
+def test_cleanup_keeps_searcher_and_role_used_by_other_runs(session, monkeypatch):
+    ec2 = session.client('ec2')
+    iam = session.client('iam')
+    searcher_id = launch_secret_searcher(ec2)
+    create_instance_profile(iam)
+
+    # Another run in progress uses the same searcher
+    reaper.start_run('ami-00000001', region)
+    reaper.journal_add([searcher_id])
+    reaper.current_run = None
+
+    monkeypatch.setattr(digger, 'secret_searcher_instance_id', searcher_id)
+    reaper.start_run('ami-00000002', region)
+    reaper.journal_add([searcher_id])
+
+    digger.cleanup(region)
+
+    assert instance_state(ec2, searcher_id) == 'running'
+    assert len(iam.list_instance_profiles()['InstanceProfiles']) == 1
+
+
+def test_cleanup_deletes_instance_profile_when_no_other_run_is_in_progress(session):
+    iam = session.client('iam')
+    create_instance_profile(iam)
+    reaper.start_run('ami-00000001', region)
+
+    digger.cleanup(region)
+
+    assert len(iam.list_instance_profiles()['InstanceProfiles']) == 0
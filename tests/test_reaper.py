@@ -0,0 +1,233 @@
+import time
+
+import boto3
+import moto
+import pytest
+from botocore.exceptions import ClientError
+
+from cloudshovel.utils import reaper
+
+region = 'us-east-1'
+tags = [{'Key': 'usage', 'Value': 'CloudQuarry'}]
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(reaper, 'runs_path', tmp_path / 'runs')
+    monkeypatch.setattr(reaper, 'current_run', None)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'testing')
+
+    with moto.mock_aws():
+        yield boto3.Session(region_name=region)
+
+
+def launch_instance(ec2, usage='CloudQuarry'):
+    image_id = ec2.describe_images(Owners=['amazon'])['Images'][0]['ImageId']
+    instance = ec2.run_instances(ImageId=image_id, MinCount=1, MaxCount=1, InstanceType='c5.large',
+                                 Placement={'AvailabilityZone': f'{region}a'},
+                                 TagSpecifications=[{'ResourceType': 'instance', 'Tags': [{'Key': 'usage', 'Value': usage}]}])
+    return instance['Instances'][0]['InstanceId']
+
+
+def create_volume(ec2, tagged=True):
+    kwargs = {'TagSpecifications': [{'ResourceType': 'volume', 'Tags': tags}]} if tagged else {}
+    return ec2.create_volume(Size=8, AvailabilityZone=f'{region}a', **kwargs)['VolumeId']
+
+
+def create_instance_profile(iam):
+    iam.create_role(RoleName='minimal-ssm', AssumeRolePolicyDocument='{}', Tags=tags)
+    iam.create_instance_profile(InstanceProfileName='minimal-ssm', Tags=tags)
+    iam.add_role_to_instance_profile(InstanceProfileName='minimal-ssm', RoleName='minimal-ssm')
+
+
+def record_run(resource_ids, finished, ami_id='ami-12345678'):
+    reaper.start_run(ami_id, region)
+    reaper.journal_add(resource_ids)
+
+    if finished:
+        reaper.finish_run()
+    else:
+        # The run is still in progress in another process
+        reaper.current_run = None
+
+
+def instance_state(ec2, instance_id):
+    return ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]['State']['Name']
+
+
+def volume_exists(ec2, volume_id):
+    volumes = ec2.describe_volumes(Filters=[{'Name': 'volume-id', 'Values': [volume_id]}])['Volumes']
+    return len(volumes) > 0
+
+
+def test_resources_of_active_runs_are_kept(session):
+    ec2 = session.client('ec2')
+    instance_id = launch_instance(ec2)
+    volume_id = create_volume(ec2)
+    record_run([instance_id, volume_id], finished=False)
+
+    summary = reaper.reap(session, [region], min_age_minutes=0)
+
+    assert instance_state(ec2, instance_id) == 'running'
+    assert volume_exists(ec2, volume_id)
+    assert summary['kept'] == 2
+
+
+def test_resources_of_finished_runs_are_reaped(session):
+    ec2 = session.client('ec2')
+    instance_id = launch_instance(ec2, usage='SecretSearcher')
+    volume_id = create_volume(ec2)
+    record_run([instance_id, volume_id], finished=True)
+
+    summary = reaper.reap(session, [region], min_age_minutes=60)
+
+    assert instance_state(ec2, instance_id) == 'terminated'
+    assert not volume_exists(ec2, volume_id)
+    assert summary['instances'] == 1
+    assert summary['volumes'] == 1
+
+
+def test_resources_not_in_journal_are_reaped_by_age(session):
+    ec2 = session.client('ec2')
+    volume_id = create_volume(ec2)
+
+    reaper.reap(session, [region], min_age_minutes=60)
+    assert volume_exists(ec2, volume_id)
+
+    reaper.reap(session, [region], min_age_minutes=0)
+    assert not volume_exists(ec2, volume_id)
+
+
+def test_dry_run_deletes_nothing(session):
+    ec2 = session.client('ec2')
+    instance_id = launch_instance(ec2)
+    volume_id = create_volume(ec2)
+    create_instance_profile(session.client('iam'))
+
+    summary = reaper.reap(session, [region], min_age_minutes=0, dry_run=True)
+
+    assert instance_state(ec2, instance_id) == 'running'
+    assert volume_exists(ec2, volume_id)
+    assert len(session.client('iam').list_instance_profiles()['InstanceProfiles']) == 1
+    assert summary['instances'] == 0
+    assert summary['volumes'] == 0
+
+
+def test_volumes_attached_to_reaped_instances_are_deleted_after_termination(session):
+    ec2 = session.client('ec2')
+    instance_id = launch_instance(ec2, usage='SecretSearcher')
+    volume_id = create_volume(ec2, tagged=False)
+    ec2.attach_volume(VolumeId=volume_id, InstanceId=instance_id, Device='/dev/sdf')
+    record_run([instance_id], finished=True)
+
+    reaper.reap(session, [region], min_age_minutes=60)
+
+    assert instance_state(ec2, instance_id) == 'terminated'
+    assert not volume_exists(ec2, volume_id)
+
+
+def test_volumes_attached_to_kept_instances_are_kept(session):
+    ec2 = session.client('ec2')
+    instance_id = launch_instance(ec2, usage='SecretSearcher')
+    volume_id = create_volume(ec2)
+    ec2.attach_volume(VolumeId=volume_id, InstanceId=instance_id, Device='/dev/sdf')
+    record_run([instance_id], finished=False)
+
+    reaper.reap(session, [region], min_age_minutes=0)
+
+    assert instance_state(ec2, instance_id) == 'running'
+    assert volume_exists(ec2, volume_id)
+
+
+def test_instance_profile_is_kept_while_resources_are_kept(session):
+    ec2 = session.client('ec2')
+    iam = session.client('iam')
+    create_instance_profile(iam)
+    launch_instance(ec2)
+
+    summary = reaper.reap(session, [region], min_age_minutes=60)
+
+    assert summary['instance_profiles'] == 0
+    assert len(iam.list_instance_profiles()['InstanceProfiles']) == 1
+
+
+def test_instance_profile_is_reaped_when_nothing_is_kept(session):
+    iam = session.client('iam')
+    create_instance_profile(iam)
+
+    summary = reaper.reap(session, [region], min_age_minutes=0)
+
+    assert summary['instance_profiles'] == 1
+    assert len(iam.list_instance_profiles()['InstanceProfiles']) == 0
+    assert len(iam.list_roles()['Roles']) == 0
+
+
+def test_failed_region_does_not_stop_the_other_regions(session, monkeypatch):
+    ec2 = session.client('ec2')
+    volume_id = create_volume(ec2)
+    create_instance_profile(session.client('iam'))
+    find_instances = reaper.find_instances
+
+    def find_instances_denied_in_eu_west_1(client):
+        if client.meta.region_name == 'eu-west-1':
+            raise ClientError({'Error': {'Code': 'UnauthorizedOperation', 'Message': 'denied'}}, 'DescribeInstances')
+        return find_instances(client)
+
+    monkeypatch.setattr(reaper, 'find_instances', find_instances_denied_in_eu_west_1)
+
+    summary = reaper.reap(session, [region, 'eu-west-1'], min_age_minutes=0)
+
+    assert not volume_exists(ec2, volume_id)
+    assert summary['failed_regions'] == ['eu-west-1']
+    assert summary['instance_profiles'] == 0
+
+
+def test_old_runs_are_pruned_from_the_journal(session):
+    record_run([], finished=True, ami_id='ami-00000001')
+    old_run_id = list(reaper.load_journal().keys())[0]
+
+    reaper.current_run = reaper.load_journal()[old_run_id]
+    reaper.current_run['started'] = time.time() - reaper.max_run_duration - 1
+    reaper.save_run()
+    reaper.current_run = None
+
+    record_run([], finished=False, ami_id='ami-00000002')
+
+    assert old_run_id not in reaper.load_journal()
+    assert len(reaper.load_journal()) == 1
+
+
+def test_reap_run_keeps_searcher_shared_with_active_runs(session):
+    ec2 = session.client('ec2')
+    searcher_id = launch_instance(ec2, usage='SecretSearcher')
+    volume_id = create_volume(ec2)
+    ec2.attach_volume(VolumeId=volume_id, InstanceId=searcher_id, Device='/dev/sdf')
+    record_run([searcher_id, volume_id], finished=False, ami_id='ami-00000001')
+
+    reaper.start_run('ami-00000002', region)
+    reaper.journal_add([searcher_id])
+    reaper.reap_run(session, region)
+
+    assert instance_state(ec2, searcher_id) == 'running'
+    assert volume_exists(ec2, volume_id)
+
+
+def test_reap_run_reaps_resources_of_the_current_run(session):
+    ec2 = session.client('ec2')
+    searcher_id = launch_instance(ec2, usage='SecretSearcher')
+    volume_id = create_volume(ec2)
+
+    reaper.start_run('ami-00000001', region)
+    reaper.journal_add([searcher_id, volume_id])
+    reaper.reap_run(session, region)
+
+    assert instance_state(ec2, searcher_id) == 'terminated'
+    assert not volume_exists(ec2, volume_id)
+    assert reaper.current_run is None
+    assert list(reaper.load_journal().values())[0]['finished'] is not None